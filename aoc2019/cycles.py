@@ -0,0 +1,58 @@
+def brent(step, start):
+    """Find the cycle that repeatedly applying step to start ends up in.
+
+    Returns (mu, lam), where mu is the number of steps before the first state
+    in the cycle is reached, and lam is the length of the cycle. States only
+    need to support ==, and only a couple of them are kept around at a time,
+    so there's no need to remember every state seen so far.
+    """
+    # find the cycle length. the tortoise waits at the hare's position while
+    # the hare takes a power of two steps, which guarantees that they meet
+    # once the tortoise is in the cycle and the power is at least lam.
+    power = lam = 1
+    tortoise = start
+    hare = step(start)
+    while tortoise != hare:
+        if power == lam:
+            tortoise = hare
+            power *= 2
+            lam = 0
+        hare = step(hare)
+        lam += 1
+
+    # with the hare lam steps ahead, the two meet at the start of the cycle
+    tortoise = hare = start
+    for _ in range(lam):
+        hare = step(hare)
+    mu = 0
+    while tortoise != hare:
+        tortoise = step(tortoise)
+        hare = step(hare)
+        mu += 1
+    return mu, lam
+
+
+def find_cycle_with_dict(step, start):
+    # the straightforward way: remember when every state was first seen
+    first_seen = dict()
+    state = start
+    while state not in first_seen:
+        first_seen[state] = len(first_seen)
+        state = step(state)
+    mu = first_seen[state]
+    return mu, len(first_seen) - mu
+
+
+def test_brent():
+    def step(x):
+        return (x * x + 1) % 255
+
+    for start in range(255):
+        assert brent(step, start) == find_cycle_with_dict(step, start)
+    # a start that's already in its cycle, and a fixed point
+    assert brent(lambda x: (x + 1) % 7, 3) == (0, 7)
+    assert brent(lambda x: x // 2, 1000) == (10, 1)
+
+
+if __name__ == "__main__":
+    test_brent()
@@ -1,9 +1,15 @@
 #!/usr/bin/env python
 
 from collections import defaultdict
-from math import atan2
+from concurrent.futures import ProcessPoolExecutor
+from fractions import Fraction
+import heapq
+from itertools import repeat
+from math import ceil, gcd
 import sys
 
+from aoc2019.utils import chunks
+
 TEST_0 = """\
 .#..#
 .....
@@ -95,10 +101,25 @@ TEST_LASER = """\
 )
 
 
-def best_score_and_loc(lines):
+def best_score_and_loc(lines, workers=1):
     asteroids = asteroid_locations(lines)
+    if workers > 1:
+        # split the candidate locations between processes. each one finds
+        # the best of its share, in order, so the overall result is the same.
+        chunk_size = ceil(len(asteroids) / workers)
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = pool.map(
+                best_of,
+                repeat(asteroids),
+                chunks(asteroids, chunk_size),
+            )
+            return max(results, key=lambda result: result[0])
+    return best_of(asteroids, asteroids)
+
+
+def best_of(asteroids, candidates):
     score_func = lambda loc: score(asteroids, loc)
-    best_loc = max(asteroids, key=score_func)
+    best_loc = max(candidates, key=score_func)
     return (score_func(best_loc), best_loc)
 
 
@@ -117,51 +138,62 @@ def dist_sq(loc1, loc2):
     return xdiff * xdiff + ydiff * ydiff
 
 
+def direction(loc, asteroid):
+    # the direction from loc to asteroid, as the smallest integer vector
+    # pointing that way. unlike an angle, it's exact, so asteroids in the
+    # same direction always get exactly the same one.
+    xdiff = asteroid[0] - loc[0]
+    ydiff = asteroid[1] - loc[1]
+    div = gcd(xdiff, ydiff)
+    return (xdiff // div, ydiff // div)
+
+
 def score(asteroids, loc):
-    # return the number of unique angles from loc to other asteroids
+    # return the number of unique directions from loc to other asteroids
     return len(
-        {
-            atan2(asteroid[0] - loc[0], asteroid[1] - loc[1])
-            for asteroid in asteroids
-            if asteroid != loc
-        }
+        {direction(loc, asteroid) for asteroid in asteroids if asteroid != loc}
     )
 
 
-def order_by_arg_then_dist(asteroids, loc):
-    arg_dist_asteroid = []
+def angle_key(ray_dir):
+    # sorts directions clockwise, starting from straight up (which is towards
+    # negative y). the right half (including straight up) comes before the
+    # left half (including straight down), and within each half, going
+    # clockwise means the slope dy / dx increases. it's all exact fractions,
+    # so directions which are the same are never split.
+    xdiff, ydiff = ray_dir
+    half = 0 if xdiff > 0 or (xdiff == 0 and ydiff < 0) else 1
+    if xdiff == 0:
+        return (half, 0, 0)
+    return (half, 1, Fraction(ydiff, xdiff))
+
+
+def destruction_keys(asteroids, laser):
+    # yield (rotation, angle key, asteroid) for each asteroid, where rotation
+    # is the number of full turns the laser makes before hitting it, i.e.
+    # the number of asteroids before it in the same direction.
+    rays = defaultdict(list)
     for asteroid in asteroids:
-        if asteroid == loc:
-            continue
-        # atan2 returns in (-pi, pi], so generate angles backwards and then
-        # negate, in order to include the lower bound.
-        arg = -atan2(asteroid[0] - loc[0], asteroid[1] - loc[1])
-        # we clearly have no time for square roots
-        dist = dist_sq(loc, asteroid)
-        arg_dist_asteroid.append((arg, dist, asteroid))
-
-    astr_by_arg = defaultdict(list)
-    # sort by arg, then by distance (squared)
-    # collect all asteroids with the same arg together, closest first
-    for arg, dist, asteroid in sorted(arg_dist_asteroid):
-        astr_by_arg[arg].append((dist, asteroid))
-    return astr_by_arg
+        if asteroid != laser:
+            rays[direction(laser, asteroid)].append(asteroid)
+    for ray_dir, ray in rays.items():
+        angle = angle_key(ray_dir)
+        ray.sort(key=lambda asteroid: dist_sq(laser, asteroid))
+        for rotation, asteroid in enumerate(ray):
+            yield (rotation, angle, asteroid)
 
 
 def destruction_order(asteroids, laser):
-    astr_by_arg = order_by_arg_then_dist(asteroids, laser)
-    while astr_by_arg:
-        to_delete = []
-        # rotate one turn...
-        for arg, same_arg_astrs in astr_by_arg.items():
-            # yield the closest item for this angle
-            yield same_arg_astrs.pop(0)[1]
-            # if no asteroids left for this angle, mark for deletion
-            if not same_arg_astrs:
-                to_delete.append(arg)
-        # cannot delete during iteration, so do it afterwards
-        for arg in to_delete:
-            del astr_by_arg[arg]
+    for _, _, asteroid in sorted(destruction_keys(asteroids, laser)):
+        yield asteroid
+
+
+def nth_destroyed(asteroids, laser, n):
+    # only the first n asteroids need to be put in order
+    first_n = heapq.nsmallest(n, destruction_keys(asteroids, laser))
+    if len(first_n) < n:
+        raise IndexError(f"only {len(first_n)} asteroids can be destroyed")
+    return first_n[-1][2]
 
 
 def test1():
@@ -218,17 +250,25 @@ def test2():
     assert destr_order[199] == (8, 2)
     assert destr_order[200] == (10, 9)
     assert destr_order[298] == (11, 1)
+    assert nth_destroyed(asteroids, (11, 13), 200) == (8, 2)
+    n_destroyed = len(destr_order)
+    assert nth_destroyed(asteroids, (11, 13), n_destroyed) == destr_order[-1]
+    try:
+        nth_destroyed(asteroids, (11, 13), n_destroyed + 1)
+    except IndexError:
+        pass
+    else:
+        assert False, "destroyed more asteroids than there are"
 
 
-def part1(lines):
-    return best_score_and_loc(lines)[0]
+def part1(lines, workers=1):
+    return best_score_and_loc(lines, workers)[0]
 
 
-def part2(lines):
-    _, laser = best_score_and_loc(lines)
+def part2(lines, workers=1):
+    _, laser = best_score_and_loc(lines, workers)
     asteroids = asteroid_locations(lines)
-    destr_order = list(destruction_order(asteroids, laser))
-    the_one = destr_order[199]
+    the_one = nth_destroyed(asteroids, laser, 200)
     return the_one[0] * 100 + the_one[1]
 
 
@@ -1,27 +1,103 @@
 #!/usr/bin/env python
 
-from itertools import chain, cycle, repeat
+from array import array
+from itertools import accumulate, repeat
+from math import comb
+from operator import add, sub
 import sys
 
 
-def coefficients(ix):
-    # very cool and very pythonic
-    gen = cycle(
-        chain(repeat(0, ix), repeat(1, ix), repeat(0, ix), repeat(-1, ix))
-    )
-    next(gen)  # throw one away
-    yield from gen
+def phase(digits, chunk_size=1024):
+    """Return the result of running one phase over digits."""
+    prefix = array("q", accumulate(digits, initial=0))
+    return phase_from_prefix(prefix, 0, len(digits), chunk_size)
+
+
+def phase_from_prefix(prefix, start, end, chunk_size=1024):
+    """Run one phase over the positions start <= pos < end of a signal.
+
+    The signal is given by its prefix sums from start: prefix[x] is the sum of
+    the digits at positions start to start + x - 1. Digits before start
+    don't matter, since the pattern for the digit at pos starts with pos
+    zeros. Returns the new digits at positions start to end - 1.
+
+    The digit at pos uses the pattern with blocks of length k = pos + 1, so
+    it's the sum of every fourth block of k digits, minus the sums of the
+    blocks two further along. With prefix sums, that's one subtraction per
+    block: the boundaries of the blocks are at j * k - 1, for j = 1, 2, ...,
+    and the prefix sums there get multiplied by -1, 1, 1, -1, -1, 1, 1, -1,
+    ...
+
+    The boundaries for a range of k's and a fixed j are evenly spaced, so
+    they can be read with a stepped slice. This works on chunk_size digits at
+    a time.
+    """
+    total = prefix[end - start]
+    result = array("b")
+    for first in range(start + 1, end + 1, chunk_size):
+        last = min(first + chunk_size, end + 1)
+        sums = [0] * (last - first)
+        # one period of the pattern (4 block boundaries) at a time. periods
+        # starting after the end of the signal add up to zero, so they can be
+        # skipped.
+        for j in range(1, end + 1, 4):
+            count = min(last, end // j + 1) - first
+            if count <= 0:
+                break
+            stop = first + count
+            columns = []
+            for jj in range(j, j + 4):
+                lo = jj * first - 1 - start
+                hi = jj * stop - 1 - start
+                column = prefix[lo:hi:jj]
+                # after the end of the signal, the prefix sums stay at the
+                # total, so that a block which sticks out of the signal just
+                # leaves out the missing part.
+                column.extend(repeat(total, count - len(column)))
+                columns.append(column)
+            minus_1, plus_2, plus_3, minus_4 = columns
+            sums[:count] = map(
+                sub,
+                map(add, map(add, sums[:count], plus_2), plus_3),
+                map(add, minus_1, minus_4),
+            )
+        result.extend(abs(total) % 10 for total in sums)
+    return result
+
+
+class RepeatedPrefix:
+    """Prefix sums for digits repeated repeats times, from position start.
+
+    Behaves like the prefix argument to phase_from_prefix(), but the values
+    are calculated from the prefix sums of a single copy of digits when
+    they're needed, instead of being stored for the whole signal.
+    """
+
+    def __init__(self, digits, repeats, start):
+        self.msg_len = len(digits)
+        self.period = array("q", accumulate(digits, initial=0))
+        self.start = start
+        self.len = self.msg_len * repeats - start + 1
+        self.base = self.from_zero(start)
+
+    def from_zero(self, pos):
+        cycles, rem = divmod(pos, self.msg_len)
+        return cycles * self.period[-1] + self.period[rem]
+
+    def __len__(self):
+        return self.len
+
+    def __getitem__(self, ix):
+        if isinstance(ix, slice):
+            return [
+                self.from_zero(self.start + x) - self.base
+                for x in range(*ix.indices(self.len))
+            ]
+        return self.from_zero(self.start + ix) - self.base
 
 
 def part1_step(msg_list):
-    for ix in range(len(msg_list)):
-        # fast and loose: modify in-place, since for ix i, the coefficient is
-        # zero for all indicies < i, so it doesn't matter that we already
-        # modified earlier digits.
-        msg_list[ix] = (
-            abs(sum(c * k for (c, k) in zip(coefficients(ix + 1), msg_list)))
-            % 10
-        )
+    msg_list[:] = phase(msg_list)
 
 
 def part1(message):
@@ -31,36 +107,107 @@ def part1(message):
     return "".join(str(i) for i in message[:8])
 
 
-def part2_step(msg_list):
-    # offset > n_relevant_digits, which means that for digit i, the coefficient
-    # is 1 for all digits after it. in other words:
-    #     digit'[i] = (digit[i] + digit[i+1] + ... + digit[-1]) % 10
-    #     (for the last digit, digit'[i] = digit[i] % 10 = digit[i])
-    # by elimination of common expressions:
-    #     digit'[i] = (digit[i] + digit'[i+1]) % 10
-    # ...since each digit only depends on the digits after it, we can modify
-    # the list in-place, starting from the next-to-last digit.
-    for ix in reversed(range(len(msg_list) - 1)):
-        msg_list[ix] = (msg_list[ix] + msg_list[ix + 1]) % 10
-
-
-def part2(message):
-    msg_len = len(message)
-    offset = int(message[:7])
-    message = [int(n) for n in message]
+# in the second half of the signal, the coefficient for digit i is 1 for all
+# digits after it. in other words:
+#     digit'[i] = (digit[i] + digit[i+1] + ... + digit[-1]) % 10
+# after p phases, this adds up to:
+#     digit[i] * C(p - 1, 0) + digit[i+1] * C(p, 1) + digit[i+2] * C(p + 1, 2)
+#     + ...
+# (all modulo 10). the binomial coefficients can be found modulo 2 and modulo
+# 5 with lucas's theorem, and most of them are zero modulo either one.
+
+
+def odd_binomials(phases, limit):
+    """Yield each k < limit where C(phases - 1 + k, k) is odd."""
+    # C(m, k) is odd iff the bits of k are a subset of the bits of m. with
+    # m = phases - 1 + k, that means k and phases - 1 have no bits in common.
+    mask = phases - 1
+    k = 0
+    while k < limit:
+        yield k
+        # the next number with none of the bits in mask
+        k = ((k | mask) + 1) & ~mask
+
+
+def binomials_mod5(phases, limit):
+    """Return (k, C(phases - 1 + k, k) % 5) for the k < limit where that
+    isn't zero."""
+    # C(m, k) % 5 is the product of C(m_i, k_i) % 5 over the base 5 digits of
+    # m and k, which is zero if any k_i > m_i. so adding k to phases - 1 can't
+    # carry, and k can be built digit by digit.
+    weights = [(0, 1)]
+    rest = phases - 1
+    place = 1
+    while place < limit:
+        rest, p_digit = divmod(rest, 5)
+        weights = [
+            (k + k_digit * place, weight * comb(p_digit + k_digit, k_digit))
+            for k, weight in weights
+            for k_digit in range(5 - p_digit)
+            if k + k_digit * place < limit
+        ]
+        place *= 5
+    return [(k, weight % 5) for k, weight in weights]
+
+
+def decode_tail(digits, repeats, offset, phases=100, n_digits=8):
+    """Return n_digits digits at offset, after running phases phases over the
+    signal made by repeating digits repeats times.
+
+    offset must be in the second half of the signal.
+    """
+    msg_len = len(digits)
     # for digits at the offset and onward, earlier digits have coefficient zero
     # and can be ignored (can be seen in matrices on problem page).
-    n_relevant_digits = msg_len * 10000 - offset
-    n_full_cycles = n_relevant_digits // msg_len
-    additional = n_relevant_digits % msg_len
-
-    reduced_msg = message[-additional:] + message * n_full_cycles
-    assert len(reduced_msg) == n_relevant_digits
-
-    # do the thing
-    for i in range(100):
-        part2_step(reduced_msg)
-    return "".join(str(i) for i in reduced_msg[:8])
+    n_relevant_digits = msg_len * repeats - offset
+    assert offset >= n_relevant_digits
+    if phases == 0:
+        return [digits[(offset + i) % msg_len] for i in range(n_digits)]
+    odd = list(odd_binomials(phases, n_relevant_digits))
+    mod5 = binomials_mod5(phases, n_relevant_digits)
+    result = []
+    for i in range(n_digits):
+        start = offset + i
+        end = n_relevant_digits - i
+        sum2 = sum(digits[(start + k) % msg_len] for k in odd if k < end)
+        sum5 = sum(
+            weight * digits[(start + k) % msg_len]
+            for k, weight in mod5
+            if k < end
+        )
+        # chinese remainder theorem: 5 * a + 6 * b is a modulo 2 and b modulo 5
+        result.append((5 * sum2 + 6 * sum5) % 10)
+    return result
+
+
+def decode(digits, repeats, offset, phases=100, n_digits=8, chunk_size=1024):
+    """Return n_digits digits at offset, after running phases phases over the
+    signal made by repeating digits repeats times.
+
+    Digits before offset don't affect the ones from offset onward, so they're
+    never computed. The digits from offset onward and their prefix sums are
+    kept in full for each phase, so memory still grows with the length of the
+    signal after offset; chunk_size only bounds the temporary lists used
+    while working through them.
+    """
+    signal_len = len(digits) * repeats
+    if offset >= signal_len - offset:
+        return decode_tail(digits, repeats, offset, phases, n_digits)
+    signal = [digits[(offset + i) % len(digits)] for i in range(n_digits)]
+    # the first phase works on the repeated digits, the later ones on
+    # whatever came out of the phase before.
+    prefix = RepeatedPrefix(digits, repeats, offset)
+    for _ in range(phases):
+        signal = phase_from_prefix(prefix, offset, signal_len, chunk_size)
+        prefix = array("q", accumulate(signal, initial=0))
+    return list(signal[:n_digits])
+
+
+def part2(message, phases=100):
+    offset = int(message[:7])
+    digits = [int(n) for n in message]
+    result = decode(digits, 10000, offset, phases)
+    return "".join(str(i) for i in result)
 
 
 def test1():
@@ -74,6 +221,13 @@ def test1():
 
 def test2():
     assert "84462026" == part2("03036732577212944063491565474664")
+    # offsets in the first half take the long way
+    digits = [int(n) for n in "80871224585914546619083218645595"]
+    assert [2, 4, 1, 7, 6, 1, 7, 6] == decode(digits, 1, 0)
+    signal = digits * 3
+    for i in range(100):
+        part1_step(signal)
+    assert signal[5:13] == decode(digits, 3, 5, chunk_size=7)
 
 
 if __name__ == "__main__":
@@ -1,179 +1,178 @@
 #!/usr/bin/env python
 
 import code
-from collections import defaultdict, namedtuple
 from itertools import chain
-import re
 import sys
 
+from aoc2019.grid import Grid, lookup_table
 from aoc2019.intcode import Computer
 
 
-Vec = namedtuple("Vec", ["x", "y"])
+SCAFFOLD = ord("#")
 
+# maps each tile to 1 if it's scaffold, and 0 otherwise.
+SCAFFOLD_BITS = lookup_table({"#": 1})
 
-def adjacent(vec):
-    return (
-        Vec(vec.x - 1, vec.y),
-        Vec(vec.x + 1, vec.y),
-        Vec(vec.x, vec.y - 1),
-        Vec(vec.x, vec.y + 1),
-    )
-
-
-def is_crossing(candidate, tiles):
-    required_scaffolds = [
-        pos for pos in chain([candidate], adjacent(candidate)) if pos in tiles
-    ]
-    return all(tiles[pos] == "#" for pos in required_scaffolds)
 
-
-def get_tiles(opcodes):
+def get_image(opcodes):
+    """Return the camera image as a Grid."""
     com = Computer(opcodes)
-    map_str = "".join(chr(i) for i in com.run())
-    return {
-        Vec(x, y): tile
-        for (y, line) in enumerate(map_str.splitlines())
-        for (x, tile) in enumerate(line)
-    }
-
-
-def part1(opcodes):
-    tiles = get_tiles(opcodes)
-    return sum(pos.x * pos.y for pos in tiles if is_crossing(pos, tiles))
+    return Grid(bytes(com.run()).decode().strip())
+
+
+def crossings(grid):
+    """Yield the cells of all scaffold intersections in the grid."""
+    # reading the grid as one (very) big number, with one byte per cell, means
+    # that the neighbours of every cell can be checked at once by shifting the
+    # whole thing. a byte is 1 in the result if the cell and all its
+    # neighbours are scaffold. the grid's border keeps the shifts from
+    # wrapping around from one row to the next.
+    scaffold = int.from_bytes(grid.classify(SCAFFOLD_BITS), "little")
+    row = 8 * grid.stride
+    crossing = (
+        scaffold
+        & (scaffold << 8)
+        & (scaffold >> 8)
+        & (scaffold << row)
+        & (scaffold >> row)
+    )
+    crossing_bytes = crossing.to_bytes(len(grid.cells), "little")
+    cell = crossing_bytes.find(1)
+    while cell != -1:
+        yield cell
+        cell = crossing_bytes.find(1, cell + 1)
 
 
-class Direction:
-    UP = Vec(0, -1)
-    DOWN = Vec(0, 1)
-    LEFT = Vec(-1, 0)
-    RIGHT = Vec(1, 0)
+def alignment_sum(grid):
+    return sum(x * y for x, y in map(grid.pos, crossings(grid)))
 
 
-rotate_left = {
-    Direction.UP: Direction.LEFT,
-    Direction.LEFT: Direction.DOWN,
-    Direction.DOWN: Direction.RIGHT,
-    Direction.RIGHT: Direction.UP,
-}
+def part1(opcodes):
+    return alignment_sum(get_image(opcodes))
 
-rotate_right = {
-    Direction.UP: Direction.RIGHT,
-    Direction.RIGHT: Direction.DOWN,
-    Direction.DOWN: Direction.LEFT,
-    Direction.LEFT: Direction.UP,
-}
 
+# the robot's possible directions, in clockwise order (up, right, down,
+# left). turning right means going to the next one.
+ROBOT_DIR = {"^": 0, ">": 1, "v": 2, "<": 3}
 
-ROBOT_DIR = {
-    "^": Direction.UP,
-    "v": Direction.DOWN,
-    "<": Direction.LEFT,
-    ">": Direction.RIGHT,
-}
 
+def get_scaffold_path(grid):
+    """Return the robot's path along the scaffold, as a list of segments.
 
-def add_vec(v_a, v_b):
-    return Vec(v_a.x + v_b.x, v_a.y + v_b.y)
+    Each segment is a turn followed by a number of steps forward, in the
+    robot's format (e.g. "L,12"). The path goes straight through any
+    intersections.
+    """
+    offsets = (-grid.stride, 1, grid.stride, -1)
+    cells = grid.cells
 
+    def walk(cell, offset):
+        # the grid's border isn't scaffold, so this never walks off the grid
+        steps = 0
+        while cells[cell + offset] == SCAFFOLD:
+            cell += offset
+            steps += 1
+        return cell, steps
 
-def get_scaffold_path(tiles, pos, direction):
-    tiles = defaultdict(int, tiles)
-    path = ""
+    # there's only one robot
+    cell = next(
+        cell for ch in ROBOT_DIR if (cell := grid.find(ch)) is not None
+    )
+    direction = ROBOT_DIR[grid[cell]]
+    segments = []
+    # the robot might already be facing along the scaffold
+    cell, steps = walk(cell, offsets[direction])
+    if steps:
+        segments.append(str(steps))
     while True:
-        # try forward
-        forward = add_vec(pos, direction)
-        if tiles[forward] == "#":
-            path += "F"  # "forward"
-            pos = forward
-            continue
-        # try left
-        ccw = rotate_left[direction]
-        if tiles[add_vec(pos, ccw)] == "#":
-            path += "L"
-            direction = ccw  # don't move, only rotate
-            continue
-        # try right
-        cw = rotate_right[direction]
-        if tiles[add_vec(pos, cw)] == "#":
-            path += "R"
-            direction = cw  # don't move, only rotate
-            continue
-        # nothing worked: reached the end
-        break
-    return path
-
-
-def condense(instructions):
-    # condense a string of instructions to the format expected by the robot.
-    # this mostly consists of compressing runs of "F"
-    res = []
-    run = 0
-    for instr in instructions:
-        if instr == "F":
-            run += 1
-        elif instr == "L":
-            if run:
-                res.append(str(run))
-            run = 0
-            res.append("L")
-        elif instr == "R":
-            if run:
-                res.append(str(run))
-            run = 0
-            res.append("R")
-    if run:
-        res.append(str(run))
-    return ",".join(res)
-
-
-def solve1(strings):
-    # is there a substring s such that each string in strings can be expressed
-    # by repeating s?
-    shortest = min(strings, key=len)
-    # if so, it must be a prefix of the shortest string
-    for length in range(len(shortest)):
-        s1 = shortest[: length + 1]
-        if len(condense(s1)) > 20:
-            break
-        # try matching each string against 1+ repeats of s1
-        regex = re.compile(f"({s1})+$")
-        if all(regex.match(string) for string in strings):
-            return s1
-    return None
-
-
-def solve2(strings):
-    # are there two substrings s1 and s2, such that each string in strings can
-    # be described as a sequence of s1 and s2?
-    shortest = min(strings, key=len)
-    # try all prefixes of the shortest string
-    for length in range(len(shortest)):
-        s2 = shortest[: length + 1]
-        if len(condense(s2)) > 20:
-            break
-        split_by_s2 = [s for string in strings for s in string.split(s2) if s]
-        if s1 := solve1(split_by_s2):
-            return s1, s2
-    return None, None
-
-
-def solve3(string):
-    for length in range(1, len(string)):
-        # one of the strings must be a prefix of the entire thing.
-        s3 = string[:length]
-        # we're assuming that everywhere s3 (or s2 or s1) can be used, it _is_
-        # used. this doesn't necessarily have to be the case, but it works for
-        # my input at least.
-        split_by_s3 = [s for s in string.split(s3) if s]
-        s1, s2 = solve2(split_by_s3)
-        if s1 is not None and s2 is not None:
-            ops = ",".join(
-                string.replace(s1, "A").replace(s2, "B").replace(s3, "C")
-            )
-            if len(ops) > 20:
-                continue
-            return ops, condense(s1), condense(s2), condense(s3)
+        for turn, rotation in (("L", 3), ("R", 1)):
+            new_direction = (direction + rotation) % 4
+            if cells[cell + offsets[new_direction]] == SCAFFOLD:
+                break
+        else:
+            # nothing worked: reached the end
+            return segments
+        direction = new_direction
+        cell, steps = walk(cell, offsets[direction])
+        segments.append(f"{turn},{steps}")
+
+
+def encoded_len(segments):
+    return sum(len(segment) for segment in segments) + len(segments) - 1
+
+
+def compress(segments, n_functions=3, max_len=20):
+    """Express segments as a main routine calling movement functions.
+
+    Returns (main, functions), where main is a list of indices into
+    functions, and each function is a tuple of segments. Neither the main
+    routine nor any function may be longer than max_len when encoded, and at
+    most n_functions functions may be used. Returns None if there is no such
+    solution.
+    """
+    segments = tuple(segments)
+    n_segments = len(segments)
+    # each call in the main routine takes up two characters (e.g. "A,"),
+    # except for the last one.
+    max_calls = (max_len + 1) // 2
+    # each segment in a function takes up at least this many characters,
+    # including the separating comma.
+    shortest = min(len(segment) for segment in segments) + 1
+    max_function_segments = (max_len + 1) // shortest
+    # (position, functions) -> most calls left with which the rest of the
+    # path could not be expressed. having fewer calls left won't help.
+    failed = dict()
+
+    def search(pos, functions, calls_left):
+        if pos == n_segments:
+            return [], functions
+        # prune if the remaining segments can't be covered, even if every
+        # call used a function of the maximum possible length.
+        if calls_left * max_function_segments < n_segments - pos:
+            return None
+        if failed.get((pos, functions), -1) >= calls_left:
+            return None
+        # try reusing any function that matches here...
+        for ix, function in enumerate(functions):
+            if segments[pos : pos + len(function)] == function:
+                rest = search(pos + len(function), functions, calls_left - 1)
+                if rest is not None:
+                    return [ix] + rest[0], rest[1]
+        # ...or define a new one, preferring longer functions
+        if len(functions) < n_functions:
+            end = pos + 1
+            while (
+                end < n_segments
+                and encoded_len(segments[pos : end + 1]) <= max_len
+            ):
+                end += 1
+            for end in reversed(range(pos + 1, end + 1)):
+                function = segments[pos:end]
+                if encoded_len(function) > max_len or function in functions:
+                    continue
+                rest = search(end, functions + (function,), calls_left - 1)
+                if rest is not None:
+                    return [len(functions)] + rest[0], rest[1]
+        failed[(pos, functions)] = calls_left
+        return None
+
+    return search(0, (), max_calls)
+
+
+def solve(segments, n_functions=3, max_len=20):
+    # returns the lines to input to the robot: the main routine, followed by
+    # the movement functions.
+    compressed = compress(segments, n_functions=n_functions, max_len=max_len)
+    if compressed is None:
+        raise ValueError("path doesn't fit in the movement functions")
+    main, functions = compressed
+    names = [chr(ord("A") + ix) for ix in range(n_functions)]
+    # the robot always expects all the functions to be defined, even the ones
+    # that aren't called.
+    functions = list(functions) + [("L",)] * (n_functions - len(functions))
+    return [",".join(names[ix] for ix in main)] + [
+        ",".join(function) for function in functions
+    ]
 
 
 def last(iterator):
@@ -185,12 +184,8 @@ def last(iterator):
 
 
 def part2(opcodes):
-    tiles = get_tiles(opcodes)
-    robot_pos, robot_dir = next(
-        (pos, ROBOT_DIR[ch]) for (pos, ch) in tiles.items() if ch in ROBOT_DIR
-    )
-    scaffold_path = get_scaffold_path(tiles, robot_pos, robot_dir)
-    lines = solve3(scaffold_path)
+    scaffold_path = get_scaffold_path(get_image(opcodes))
+    lines = solve(scaffold_path)
     full_input = "".join(line + "\n" for line in chain(lines, "n"))
     # modifying the input argument here, but it's not like we'll need it again
     opcodes[0] = 2
@@ -199,7 +194,97 @@ def part2(opcodes):
     return last(com.run())
 
 
+TEST_IMAGE_1 = """\
+..#..........
+..#..........
+#######...###
+#.#...#...#.#
+#############
+..#...#...#..
+..#####...^..
+"""
+
+
+TEST_IMAGE_2 = """\
+#######...#####
+#.....#...#...#
+#.....#...#...#
+......#...#...#
+......#...###.#
+......#.....#.#
+^########...#.#
+......#.#...#.#
+......#########
+........#...#..
+....#########..
+....#...#......
+....#...#......
+....#...#......
+....#####......
+"""
+
+
+def test1():
+    grid = Grid(TEST_IMAGE_1)
+    assert sorted(map(grid.pos, crossings(grid))) == [
+        (2, 2),
+        (2, 4),
+        (6, 4),
+        (10, 4),
+    ]
+    assert alignment_sum(grid) == 76
+
+
+# the path from the example in part 2
+TEST_PATH = "R,8 R,8 R,4 R,4 R,8 L,6 L,2 R,4 R,4 R,8 R,8 R,8 L,6 L,2".split()
+
+
+def check_compressed(segments, compressed, n_functions, max_len):
+    main, functions = compressed
+    assert [seg for ix in main for seg in functions[ix]] == list(segments)
+    assert len(functions) <= n_functions
+    assert 2 * len(main) - 1 <= max_len
+    assert all(encoded_len(function) <= max_len for function in functions)
+
+
+def test2():
+    assert get_scaffold_path(Grid(TEST_IMAGE_2)) == TEST_PATH
+    # a robot that already faces along the scaffold starts by going straight
+    assert get_scaffold_path(Grid("..#\n..#\n.>#")) == ["1", "L,2"]
+    check_compressed(TEST_PATH, compress(TEST_PATH), 3, 20)
+    # with shorter functions, it finds the example's own solution
+    assert solve(TEST_PATH, max_len=11) == [
+        "A,B,C,B,A,C",
+        "R,8,R,8",
+        "R,4,R,4,R,8",
+        "L,6,L,2",
+    ]
+    assert compress(TEST_PATH, max_len=10) is None
+    # other numbers of functions
+    check_compressed(TEST_PATH, compress(TEST_PATH, 2, 30), 2, 30)
+    assert compress(TEST_PATH, 2, 20) is None
+    check_compressed(TEST_PATH, compress(TEST_PATH, 4, 11), 4, 11)
+    # no segment repeats, and each function fits four of them
+    unique = [f"R,{steps}" for steps in range(10, 23)]
+    assert compress(unique[:12]) is not None
+    try:
+        solve(unique)
+    except ValueError:
+        pass
+    else:
+        assert False, "compressed a path that doesn't fit"
+    check_compressed(unique, compress(unique, 4), 4, 20)
+    # unused functions are still defined
+    assert solve(unique[:4], n_functions=2) == [
+        "A",
+        "R,10,R,11,R,12,R,13",
+        "L",
+    ]
+
+
 if __name__ == "__main__":
+    test1()
+    test2()
     with open(sys.argv[1]) as f:
         opcodes = [int(o) for o in f.read().strip().split(",")]
 
@@ -1,208 +1,574 @@
 #!/usr/bin/env python
 
-from collections import defaultdict, namedtuple
-from dataclasses import dataclass
+from collections import defaultdict
+from functools import reduce
 import heapq
-from itertools import chain, combinations
+from itertools import combinations
+from operator import or_
+from string import ascii_lowercase, ascii_uppercase
 import sys
-from typing import FrozenSet, Tuple
 
+from aoc2019.grid import Grid, lookup_table
 
-Vec = namedtuple("Vec", ["x", "y"])
 
+# keys are numbered 0-25, and start positions are numbered after them.
+N_KEYS = 26
 
-def adjacent(vec):
-    return (
-        Vec(vec.x - 1, vec.y),
-        Vec(vec.x + 1, vec.y),
-        Vec(vec.x, vec.y - 1),
-        Vec(vec.x, vec.y + 1),
-    )
+# a search state is packed into a single int: the low N_KEYS bits are the set
+# of collected keys, and above them are the robots' positions (as node
+# numbers), POS_BITS bits each.
+POS_BITS = 5
+POS_MASK = (1 << POS_BITS) - 1
+KEYS_MASK = (1 << N_KEYS) - 1
 
 
-def print_map(tiles):
-    """Print map, for debugging purposes."""
-    min_x = min(pos.x for pos in tiles)
-    max_x = max(pos.x for pos in tiles)
-    min_y = min(pos.y for pos in tiles)
-    max_y = max(pos.y for pos in tiles)
-    for y in range(min_y, max_y + 1):
-        for x in range(min_x, max_x + 1):
-            print(tiles[Vec(x, y)], end="")
-        print("")
-    print("")
+def key_bit(tile):
+    # works for both keys and doors
+    return 1 << (ord(tile.lower()) - ord("a"))
 
 
-def a_star(tiles, start, goal):
-    """Find the shortest path from start to goal."""
-    dist = defaultdict(lambda: 999999999999999)
-    dist[start] = 0
-    came_from = dict()
-    to_visit = {start}
-    while to_visit:
-        # use taxicab_dist as heuristic
-        curr = min(
-            to_visit,
-            key=lambda coords: dist[coords] + taxicab_dist(coords, goal),
-        )
-        if curr == goal:
-            return a_star_collect_path(curr, start, came_from)
-        to_visit.remove(curr)
-        for neighbour in adjacent(curr):
-            if tiles[neighbour] == "#":
-                continue
-            dist_via_curr = dist[curr] + 1
-            if dist_via_curr < dist[neighbour]:
-                # found a better route to this node
-                dist[neighbour] = dist_via_curr
-                came_from[neighbour] = curr
-                to_visit.add(neighbour)
-    return None
-
+def node_number(tile, start_nodes):
+    if tile.islower():
+        return ord(tile) - ord("a")
+    return N_KEYS + start_nodes.index(tile)
 
-def a_star_collect_path(curr, start, came_from):
-    path = [curr]
-    while curr != start:
-        curr = came_from[curr]
-        path.append(curr)
-    return list(reversed(path))
 
+# lookup tables for the tiles of the map, indexed by byte value
+WALLS = lookup_table({"#": 1})
+DOOR_BITS = lookup_table(
+    {door: key_bit(door) for door in ascii_uppercase[:N_KEYS]}
+)
+KEY_NODES = lookup_table(
+    {key: ix for ix, key in enumerate(ascii_lowercase[:N_KEYS])}, default=-1
+)
 
-def taxicab_dist(v_a, v_b):
-    return abs(v_a.x - v_b.x) + abs(v_a.y - v_b.y)
 
+def make_graph(grid, start_nodes):
+    """Make an adjacency matrix between keys and start positions.
 
-def make_graph(tiles, start_nodes):
-    """Make a neighbour dict graph."""
-    graph = defaultdict(dict)
-    tiles = defaultdict(str, tiles)
-    all_keys = [
-        (pos, tile)
-        for (pos, tile) in tiles.items()
-        if tile.islower() or tile in start_nodes
-    ]
-    for (fr_pos, fr_tile), (to_pos, to_tile) in combinations(all_keys, 2):
-        # using A* is probably a bad choice here, using dijkstra once for each
-        # node to find the distance to all other nodes should be better.
-        path = a_star(tiles, fr_pos, to_pos)
-        if path is None:
+    graph[fr][to] is a list of (dist, doors) tuples, where doors is a bitmask
+    of the doors on the way (using the same bits as the keys). There can be
+    several ways to get from fr to to, where a longer one needs fewer keys,
+    so the list has every way that isn't beaten by another one on both
+    counts. It's empty if to can't be reached from fr without passing
+    another key first. Going past a key picks it up, so any such path is
+    better described as two separate edges.
+    """
+    n_nodes = N_KEYS + len(start_nodes)
+    graph = [[[] for _ in range(n_nodes)] for _ in range(n_nodes)]
+    cells = grid.cells
+    walls = grid.classify(WALLS)
+    for fr_tile in ascii_lowercase[:N_KEYS] + start_nodes:
+        fr_cell = grid.find(fr_tile)
+        if fr_cell is None:
             continue
-        # convert doors to lower so we can compare them to keys more easily.
-        path_doors = frozenset(
-            tiles[path_pos].lower()
-            for path_pos in path
-            if tiles[path_pos].isupper()
-        )
-        result = (len(path) - 1, path_doors)
-        # don't create edges leading to the starting position(s)
-        if to_tile.islower():
-            graph[fr_tile][to_tile] = result
-        if fr_tile.islower():
-            graph[to_tile][fr_tile] = result
+        fr = node_number(fr_tile, start_nodes)
+        # one breadth-first search finds the distances to all other keys,
+        # keeping track of the doors passed on the way. a cell is only
+        # entered again with a set of doors that doesn't include any set it
+        # was entered with before, since those earlier ways were no longer
+        # and needed no more keys.
+        seen_doors = [None] * len(cells)
+        seen_doors[fr_cell] = [0]
+        frontier = [(fr_cell, 0)]
+        dist = 0
+        while frontier:
+            dist += 1
+            new_frontier = []
+            for cell, doors in frontier:
+                for offset in grid.offsets:
+                    adj = cell + offset
+                    if walls[adj]:
+                        continue
+                    adj_doors = doors | DOOR_BITS[cells[adj]]
+                    known = seen_doors[adj]
+                    if known is None:
+                        seen_doors[adj] = [adj_doors]
+                    elif any(seen & adj_doors == seen for seen in known):
+                        continue
+                    else:
+                        known.append(adj_doors)
+                    to = KEY_NODES[cells[adj]]
+                    if to >= 0:
+                        # don't create edges leading to the starting
+                        # position(s), and don't search past keys
+                        graph[fr][to].append((dist, adj_doors))
+                        continue
+                    new_frontier.append((adj, adj_doors))
+            frontier = new_frontier
     return graph
 
 
-def fancy_dijkstra(graph, start_node):
-    n_keys = len([name for name in graph if name.islower()])
-    dist = defaultdict(lambda: 999999999999999)
-    dist[start_node] = 0
-    queue = [(0, start_node)]
+def shortest_dists(graph):
+    """Return the shortest distances between all nodes, ignoring doors."""
+    n_nodes = len(graph)
+    no_path = float("inf")
+    dists = [[no_path] * n_nodes for _ in range(n_nodes)]
+    for fr, row in enumerate(graph):
+        dists[fr][fr] = 0
+        for to, edges in enumerate(row):
+            for dist, _ in edges:
+                # edges are only created towards keys, but can be walked both
+                # ways
+                dists[fr][to] = min(dists[fr][to], dist)
+                dists[to][fr] = min(dists[to][fr], dist)
+    # floyd-warshall, there are only a few dozen nodes
+    for via in range(n_nodes):
+        dists_via = dists[via]
+        for fr in range(n_nodes):
+            fr_via = dists[fr][via]
+            if fr_via == no_path:
+                continue
+            dists_fr = dists[fr]
+            for to in range(n_nodes):
+                if fr_via + dists_via[to] < dists_fr[to]:
+                    dists_fr[to] = fr_via + dists_via[to]
+    return dists
+
+
+def bits(mask):
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+def reachable_keys(dists, node):
+    """Return a bitmask of the keys reachable from node, ignoring doors."""
+    reachable = 0
+    for key in range(N_KEYS):
+        if dists[node][key] != float("inf"):
+            reachable |= 1 << key
+    return reachable
+
+
+def make_heuristic(graph, starts):
+    """Make a lower bound on the remaining distance from a search state.
+
+    Each group of robots that can reach the same keys still has to visit all
+    of those keys. Doing so costs at least the weight of a minimum spanning
+    tree connecting the remaining keys and the robots' positions. For a
+    single robot that's the distance to the closest remaining key plus the
+    spanning tree of the remaining keys alone, which is tighter and can be
+    cached per set of keys.
+    """
+    dists = shortest_dists(graph)
+    shifts = [N_KEYS + POS_BITS * ix for ix in range(len(starts))]
+    # group the robots by which keys they can reach. ignoring doors, these
+    # are connected components, so two robots can either reach exactly the
+    # same keys or no common keys at all.
+    groups = defaultdict(list)
+    for shift, start in zip(shifts, starts):
+        groups[reachable_keys(dists, start)].append(shift)
+    groups = list(groups.items())
+
+    def spanning_tree(nodes, root_dists=None):
+        # prim's algorithm. if root_dists is given, the tree also includes a
+        # root node with those distances to each node.
+        if root_dists is None:
+            nodes = list(nodes)
+            root_dists = dists[nodes.pop()]
+        weight = 0
+        closest = {node: root_dists[node] for node in nodes}
+        while closest:
+            node = min(closest, key=closest.get)
+            weight += closest.pop(node)
+            node_dists = dists[node]
+            for other in closest:
+                if node_dists[other] < closest[other]:
+                    closest[other] = node_dists[other]
+        return weight
+
+    key_trees = dict()
+
+    def heuristic(state):
+        keys = state & KEYS_MASK
+        estimate = 0
+        for reachable, group_shifts in groups:
+            remaining = reachable & ~keys
+            if not remaining:
+                continue
+            positions = [(state >> shift) & POS_MASK for shift in group_shifts]
+            if len(positions) == 1:
+                pos_dists = dists[positions[0]]
+                estimate += min(pos_dists[key] for key in bits(remaining))
+                if remaining not in key_trees:
+                    key_trees[remaining] = spanning_tree(bits(remaining))
+                estimate += key_trees[remaining]
+            else:
+                # any of the robots can act as the root of the tree
+                root_dists = [
+                    min(dists[pos][node] for pos in positions)
+                    for node in range(len(dists))
+                ]
+                estimate += spanning_tree(bits(remaining), root_dists)
+        return estimate
+
+    return heuristic
+
+
+class DominanceIndex:
+    """Remembers the best costs found for each search state.
+
+    A state is dominated if the same robot positions have been reached with
+    at least the same keys for at most the same cost, since anything that can
+    be done from that state can be done at least as well from the other one.
+
+    Checking against every known superset of keys is slow, so only the exact
+    set of keys and the sets with one more key are checked. The latter is the
+    typical case: another route picked up one more key on the way, at the
+    same or lower cost.
+    """
+
+    def __init__(self, all_keys):
+        self.all_keys = all_keys
+        self.costs = dict()
+
+    def cost(self, state):
+        """Return the best known cost of state, or None."""
+        return self.costs.get(state)
+
+    def add(self, state, cost):
+        """Add state unless it's dominated. Returns whether it was added."""
+        costs = self.costs
+        if costs.get(state, cost + 1) <= cost:
+            return False
+        for key in bits(self.all_keys & ~state):
+            if costs.get(state | (1 << key), cost + 1) <= cost:
+                return False
+        costs[state] = cost
+        return True
+
+
+def fancy_dijkstra(graph, starts, all_keys, heuristic=None, route=None):
+    """Find the shortest total distance for the robots to collect all_keys.
+
+    starts are the robots' starting nodes, and all_keys is a bitmask. If a
+    heuristic is given (which must never overestimate the remaining
+    distance), this is A* rather than dijkstra. If route is given, it should
+    be a list, which is filled in with the states along the shortest route.
+    """
+    shifts = [N_KEYS + POS_BITS * ix for ix in range(len(starts))]
+    edges = [
+        [
+            (to, dist, doors)
+            for to, pair_edges in enumerate(row)
+            for dist, doors in pair_edges
+        ]
+        for row in graph
+    ]
+    if heuristic is None:
+        heuristic = lambda state: 0
+    start_state = 0
+    for shift, start in zip(shifts, starts):
+        start_state |= start << shift
+    index = DominanceIndex(all_keys)
+    index.add(start_state, 0)
+    came_from = dict()
+    queue = [(heuristic(start_state), 0, start_state)]
     while queue:
-        dist_to_curr, curr = heapq.heappop(queue)
-        if len(curr.keys) == n_keys:
+        _, dist_to_curr, curr = heapq.heappop(queue)
+        if index.cost(curr) < dist_to_curr:
+            # already found a better way here
+            continue
+        keys = curr & KEYS_MASK
+        if keys == all_keys:
+            if route is not None:
+                while curr != start_state:
+                    route.append(curr)
+                    curr = came_from[curr]
+                route.append(start_state)
+                route.reverse()
             return dist_to_curr
-        for neighb_node, edge_cost in curr.edges(graph):
-            dist_to_neighb = dist_to_curr + edge_cost
-            # this lookup is quite stupid - it checks whether we have a better
-            # cost for this exact set of collected keys. of course, if we have
-            # a better cost with a superset of the keys here, there's no reason
-            # to save this cost.
-            # checking for this "domination" criterion should be better
-            # asymptotically, but in practice, at least the naive implementation
-            # is considerably slower. it does use ~40% less memory, though.
-            if dist_to_neighb < dist[neighb_node]:
-                dist[neighb_node] = dist_to_neighb
-                heapq.heappush(queue, (dist_to_neighb, neighb_node))
+        for shift in shifts:
+            fr = (curr >> shift) & POS_MASK
+            # the state with this robot removed
+            others = curr & ~(POS_MASK << shift)
+            for to, edge_cost, doors in edges[fr]:
+                if doors & ~keys:
+                    # missing the key for at least one door
+                    continue
+                neighb = others | (to << shift) | (1 << to)
+                dist_to_neighb = dist_to_curr + edge_cost
+                if index.add(neighb, dist_to_neighb):
+                    if route is not None:
+                        came_from[neighb] = curr
+                    estimate = dist_to_neighb + heuristic(neighb)
+                    heapq.heappush(queue, (estimate, dist_to_neighb, neighb))
     havoc = ValueError("grrr")
     raise havoc
 
 
-@dataclass(frozen=True)
-class Part1Node:
-    name: str
-    keys: FrozenSet[str]
-
-    def edges(self, graph):
-        for to, (dist, doors) in graph[self.name].items():
-            if doors.issubset(self.keys):
-                to_keys = frozenset(chain(self.keys, (to,)))
-                yield Part1Node(to, to_keys), dist
-
-    def cmp_repr(self):
-        return (len(self.keys), self.name)
-
-    def __lt__(self, other):
-        return self.cmp_repr().__lt__(other.cmp_repr())
+def collect_separately(graph, starts, all_keys):
+    """Try to have each robot collect its keys without regard to the others.
+
+    This works when the robots can't reach any common keys. Each robot's
+    keys are then collected as if it were alone, treating doors whose keys
+    are elsewhere as open: another robot can fetch those keys while it
+    waits, which doesn't add any steps. That only holds up if there's some
+    order of the robots' moves in which nobody waits for a key that is
+    itself behind a door waiting for them, so this is checked afterwards.
+
+    Returns the total distance, or None if the robots have to be considered
+    together (or if some key can't be reached at all).
+    """
+    dists = shortest_dists(graph)
+    reachable = [reachable_keys(dists, start) for start in starts]
+    if any(a & b for a, b in combinations(reachable, 2)):
+        return None
+    # a key that no robot can reach makes the vault unsolvable, but solving
+    # each robot's part alone would never notice it missing. leave that to
+    # the search over all robots.
+    if reduce(or_, reachable) != all_keys:
+        return None
+    total = 0
+    # for each robot, a list of (doors, key) for each key it collects, in
+    # order, with the doors on the way to it that need other robots' keys
+    schedules = []
+    for start, own_keys in zip(starts, reachable):
+        others_keys = all_keys & ~own_keys
+        own_graph = [
+            [
+                [(dist, doors & ~others_keys) for dist, doors in edges]
+                for edges in row
+            ]
+            for row in graph
+        ]
+        route = []
+        total += fancy_dijkstra(
+            own_graph,
+            [start],
+            all_keys & own_keys,
+            make_heuristic(own_graph, [start]),
+            route,
+        )
+        schedule = []
+        for fr, to in zip(route, route[1:]):
+            fr_node = fr >> N_KEYS
+            to_node = to >> N_KEYS
+            held = fr & KEYS_MASK
+            # the route took the shortest of the edges whose own doors it
+            # could open. if there are several, prefer waiting for fewer
+            # doors of the others.
+            _, doors = min(
+                (
+                    (dist, doors & others_keys)
+                    for dist, doors in graph[fr_node][to_node]
+                    if not doors & ~others_keys & ~held
+                ),
+                key=lambda edge: (edge[0], bin(edge[1]).count("1")),
+            )
+            schedule.append((doors, 1 << to_node))
+        schedules.append(schedule)
+
+    # let every robot go as far as it can, until either everyone is done or
+    # everyone is stuck waiting for someone else.
+    keys = 0
+    progress = [0] * len(schedules)
+    moved = True
+    while moved:
+        moved = False
+        for ix, schedule in enumerate(schedules):
+            while progress[ix] < len(schedule):
+                doors, key = schedule[progress[ix]]
+                if doors & ~keys:
+                    break
+                keys |= key
+                progress[ix] += 1
+                moved = True
+    if all(done == len(s) for done, s in zip(progress, schedules)):
+        return total
+    return None
 
 
-def get_tiles(map_str):
-    return {
-        Vec(x, y): tile
-        for (y, line) in enumerate(map_str.splitlines())
-        for (x, tile) in enumerate(line)
-    }
+def key_mask(grid):
+    mask = 0
+    for key in ascii_lowercase[:N_KEYS]:
+        if grid.find(key) is not None:
+            mask |= key_bit(key)
+    return mask
 
 
 def part1(map_str):
-    tiles = get_tiles(map_str)
-    pairwise = make_graph(tiles, "@")
-    start_node = Part1Node("@", frozenset())
-    return fancy_dijkstra(pairwise, start_node)
-
-
-@dataclass(frozen=True)
-class Part2Node:
-    name: Tuple[str]
-    keys: FrozenSet[str]
-
-    def edges(self, graph):
-        for ix, fr in enumerate(self.name):
-            for to, (dist, doors) in graph[fr].items():
-                if doors.issubset(self.keys):
-                    to_names = list(self.name)
-                    to_names[ix] = to
-                    to_keys = frozenset(chain(self.keys, (to,)))
-                    yield Part2Node(tuple(to_names), to_keys), dist
-
-    def cmp_repr(self):
-        return (len(self.keys), self.name)
-
-    def __lt__(self, other):
-        return self.cmp_repr().__lt__(other.cmp_repr())
+    grid = Grid(map_str, fill="#")
+    graph = make_graph(grid, "@")
+    starts = [N_KEYS]
+    heuristic = make_heuristic(graph, starts)
+    return fancy_dijkstra(graph, starts, key_mask(grid), heuristic)
 
 
 PART2_CENTER = """\
 @#$
 ###
-£#€"""
+%#&"""
 
 
-def part2_modify_map(tiles):
-    start = next(pos for (pos, tile) in tiles.items() if tile == "@")
-    center_tiles = get_tiles(PART2_CENTER)
-    for delta, tile in center_tiles.items():
-        tiles[Vec(start.x + delta.x - 1, start.y + delta.y - 1)] = tile
+def part2_modify_map(grid):
+    start_x, start_y = grid.pos(grid.find("@"))
+    for y, line in enumerate(PART2_CENTER.splitlines()):
+        for x, tile in enumerate(line):
+            grid[grid.cell(start_x + x - 1, start_y + y - 1)] = tile
 
 
 def part2(map_str):
-    tiles = get_tiles(map_str)
-    part2_modify_map(tiles)
-    graph = make_graph(tiles, "@£$€")
-    start_node = Part2Node(("@", "£", "$", "€"), frozenset())
-    return fancy_dijkstra(graph, start_node)
+    grid = Grid(map_str, fill="#")
+    part2_modify_map(grid)
+    start_nodes = "@%$&"
+    graph = make_graph(grid, start_nodes)
+    starts = [N_KEYS + ix for ix in range(len(start_nodes))]
+    all_keys = key_mask(grid)
+    # usually, each robot is in a separate part of the vault, and they can be
+    # solved one at a time. otherwise, search over all robots at once.
+    total = collect_separately(graph, starts, all_keys)
+    if total is not None:
+        return total
+    heuristic = make_heuristic(graph, starts)
+    return fancy_dijkstra(graph, starts, all_keys, heuristic)
+
+
+TEST1_0 = """\
+#########
+#b.A.@.a#
+#########
+"""
+
+
+TEST1_1 = """\
+########################
+#f.D.E.e.C.b.A.@.a.B.c.#
+######################.#
+#d.....................#
+########################
+"""
+
+
+TEST1_2 = """\
+########################
+#...............b.C.D.f#
+#.######################
+#.....@.a.B.c.d.A.e.F.g#
+########################
+"""
+
+
+TEST1_3 = """\
+#################
+#i.G..c...e..H.p#
+########.########
+#j.A..b...f..D.o#
+########@########
+#k.E..a...g..B.n#
+########.########
+#l.F..d...h..C.m#
+#################
+"""
+
+
+TEST1_4 = """\
+########################
+#@..............ac.GI.b#
+###d#e#f################
+###A#B#C################
+###g#h#i################
+########################
+"""
+
+
+# a longer way to a key can need fewer doors opened than a shorter one
+TEST1_DOORS = """\
+#######
+##c##.#
+#....##
+#..@.A#
+#....b#
+#..#.a#
+#######
+"""
+
+
+TEST2_0 = """\
+#######
+#a.#Cd#
+##...##
+##.@.##
+##...##
+#cB#Ab#
+#######
+"""
+
+
+TEST2_1 = """\
+###############
+#d.ABC.#.....a#
+######...######
+######.@.######
+######...######
+#b.....#.....c#
+###############
+"""
+
+
+TEST2_2 = """\
+#############
+#DcBa.#.GhKl#
+#.###...#I###
+#e#d#.@.#j#k#
+###C#...###J#
+#fEbA.#.FgHi#
+#############
+"""
+
+
+TEST2_3 = """\
+#############
+#g#f.D#..h#l#
+#F###e#E###.#
+#dCba...BcIJ#
+#####.@.#####
+#nK.L...G...#
+#M###N#H###.#
+#o#m..#i#jk.#
+#############
+"""
+
+
+# the b is walled off from every robot
+TEST2_UNREACHABLE = """\
+#########
+#a.#Cd#b#
+##...####
+##.@.####
+##...####
+#c.#A.###
+#########
+"""
+
+
+def test1():
+    assert part1(TEST1_0) == 8
+    assert part1(TEST1_1) == 86
+    assert part1(TEST1_2) == 132
+    assert part1(TEST1_3) == 136
+    assert part1(TEST1_4) == 81
+    assert part1(TEST1_DOORS) == 10
+
+
+def test2():
+    assert part2(TEST2_0) == 8
+    assert part2(TEST2_1) == 24
+    assert part2(TEST2_2) == 32
+    assert part2(TEST2_3) == 72
+    try:
+        part2(TEST2_UNREACHABLE)
+    except ValueError:
+        pass
+    else:
+        assert False, "collected a key that can't be reached"
 
 
 if __name__ == "__main__":
+    test1()
+    test2()
     with open(sys.argv[1]) as f:
         map_str = f.read()
 
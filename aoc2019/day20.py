@@ -1,11 +1,11 @@
 #!/usr/bin/env python
 
 from collections import defaultdict, namedtuple
-from dataclasses import dataclass
 import heapq
-from itertools import chain, combinations
 import sys
-from typing import FrozenSet, Tuple
+
+from aoc2019.grid import Grid, lookup_table
+from aoc2019.pathfinding import distance_map
 
 
 Vec = namedtuple("Vec", ["x", "y"])
@@ -14,40 +14,35 @@ Vec = namedtuple("Vec", ["x", "y"])
 Portal = namedtuple("Portal", ["pos", "level_delta"])
 
 
-def adjacent(vec):
-    return (
-        Vec(vec.x - 1, vec.y),
-        Vec(vec.x + 1, vec.y),
-        Vec(vec.x, vec.y - 1),
-        Vec(vec.x, vec.y + 1),
-    )
-
-
-def dijkstra(edges_fun, tiles, portals, start, goal):
+def dijkstra(edges_fun, graph, start, goal, heuristic=lambda node: 0):
+    # with a heuristic this is really A*. the heuristic must never
+    # overestimate the distance to the goal, but it doesn't need to be
+    # consistent: nodes are searched again if a shorter route to them is found.
     dist = defaultdict(lambda: 999999999999999)
     dist[start] = 0
-    queue = [(0, start)]
+    queue = [(heuristic(start), 0, start)]
     while queue:
-        dist_to_curr, curr = heapq.heappop(queue)
+        _, dist_to_curr, curr = heapq.heappop(queue)
         if curr == goal:
             return dist_to_curr
-        for neighb in edges_fun(curr, tiles, portals):
-            dist_to_neighb = dist_to_curr + 1
-            if dist_to_neighb < dist[neighb]:
-                dist[neighb] = dist_to_neighb
-                heapq.heappush(queue, (dist_to_neighb, neighb))
+        if dist_to_curr > dist[curr]:
+            # already found a better way here
+            continue
+        for neighb, edge_cost in edges_fun(curr, graph):
+            dist_to_neighb = dist_to_curr + edge_cost
+            if dist_to_neighb >= dist[neighb]:
+                continue
+            estimate = dist_to_neighb + heuristic(neighb)
+            # once some route to the goal is known, there's no point in going
+            # anywhere that can't lead to a shorter one.
+            if neighb != goal and estimate >= dist[goal]:
+                continue
+            dist[neighb] = dist_to_neighb
+            heapq.heappush(queue, (estimate, dist_to_neighb, neighb))
     havoc = ValueError("grrr")
     raise havoc
 
 
-def get_tiles(map_str):
-    return {
-        Vec(x, y): tile
-        for (y, line) in enumerate(map_str.splitlines())
-        for (x, tile) in enumerate(line)
-    }
-
-
 def vertical_portals(map_str):
     # see "horizontal_portals()"
     map_str_transposed = "\n".join(
@@ -101,47 +96,177 @@ def get_portals(map_str):
     return start, goal, portals
 
 
-def part1edges(pos, tiles, portals):
+Edge = namedtuple("Edge", ["to", "dist", "level_delta"])
+
+
+OPEN = lookup_table({".": 1})
+
+
+def portal_graph(grid, start, goal, portals):
+    """Make a weighted graph between the start, the goal and all portals.
+
+    graph[pos] is a list of Edges from pos: walking to any other reachable
+    portal (or the start or goal), and going through pos's own portal.
+    """
+    graph = dict()
+    passable = grid.classify(OPEN)
+    endpoints = [start, goal, *portals]
+    cells = [grid.cell(pos.x, pos.y) for pos in endpoints]
+    for fr, fr_cell in zip(endpoints, cells):
+        # one breadth-first search finds the distances to all the others
+        dist = distance_map(passable, [fr_cell], grid.offsets)
+        graph[fr] = [
+            Edge(to, dist[to_cell], 0)
+            for to, to_cell in zip(endpoints, cells)
+            if to != fr and dist[to_cell] >= 0
+        ]
+        if fr in portals:
+            graph[fr].append(Edge(portals[fr].pos, 1, portals[fr].level_delta))
+    return graph
+
+
+def part1edges(pos, graph):
     # part 1 uses the raw positions as nodes.
-    for adj in adjacent(pos):
-        if tiles[pos] == ".":
-            yield adj
-    if pos in portals:
-        yield portals[pos].pos
+    for edge in graph[pos]:
+        yield edge.to, edge.dist
 
 
 def part1(map_str):
-    tiles = get_tiles(map_str)
+    grid = Grid(map_str)
     start, goal, portals = get_portals(map_str)
-    return dijkstra(part1edges, tiles, portals, start, goal)
+    graph = portal_graph(grid, start, goal, portals)
+    return dijkstra(part1edges, graph, start, goal)
 
 
 Part2Node = namedtuple("Part2Node", ["pos", "level"])
 
 
-def part2edges(node, tiles, portals):
+def part2edges(node, graph):
     # part 2 uses (surprise!) Part2Nodes as nodes.
-    for adj in adjacent(node.pos):
-        if tiles[adj] == ".":
-            yield Part2Node(adj, node.level)
-    if node.pos in portals:
-        portal = portals[node.pos]
-        level = node.level + portal.level_delta
+    for edge in graph[node.pos]:
+        level = node.level + edge.level_delta
         # ensure that we don't use outer portals on the initial level
         if level >= 0:
-            yield Part2Node(portal.pos, level)
+            yield Part2Node(edge.to, level), edge.dist
+
+
+def min_inner_to_outer(graph, portals):
+    # the shortest walk from an inner portal to an outer portal. after going
+    # out a level you arrive at an inner portal, so this has to be walked
+    # (at least) once for each level but the last on the way back to level 0.
+    return min(
+        (
+            edge.dist
+            for fr, edges in graph.items()
+            if fr in portals and portals[fr].level_delta > 0
+            for edge in edges
+            if edge.level_delta == 0
+            and edge.to in portals
+            and portals[edge.to].level_delta < 0
+        ),
+        default=0,
+    )
 
 
 def part2(map_str):
-    tiles = get_tiles(map_str)
+    grid = Grid(map_str)
     start, goal, portals = get_portals(map_str)
+    graph = portal_graph(grid, start, goal, portals)
+    min_walk = min_inner_to_outer(graph, portals)
+
+    def heuristic(node):
+        # getting back to level 0 takes at least one step through an outer
+        # portal per level, with a walk between each of them. since this grows
+        # with the level, it stops the search from going deeper than the
+        # shortest known route to the goal allows. nothing limits the depth
+        # before some route is known, though: if there isn't any, the search
+        # never ends.
+        if node.level == 0:
+            return 0
+        return node.level + (node.level - 1) * min_walk
+
     # start and end on level 0.
     start = Part2Node(start, 0)
     goal = Part2Node(goal, 0)
-    return dijkstra(part2edges, tiles, portals, start, goal)
+    return dijkstra(part2edges, graph, start, goal, heuristic)
+
+
+TEST1 = """\
+         A           
+         A           
+  #######.#########  
+  #######.........#  
+  #######.#######.#  
+  #######.#######.#  
+  #######.#######.#  
+  #####  B    ###.#  
+BC...##  C    ###.#  
+  ##.##       ###.#  
+  ##...DE  F  ###.#  
+  #####    G  ###.#  
+  #########.#####.#  
+DE..#######...###.#  
+  #.#########.###.#  
+FG..#########.....#  
+  ###########.#####  
+             Z       
+             Z       
+"""
+
+
+TEST2 = """\
+             Z L X W       C                 
+             Z P Q B       K                 
+  ###########.#.#.#.#######.###############  
+  #...#.......#.#.......#.#.......#.#.#...#  
+  ###.#.#.#.#.#.#.#.###.#.#.#######.#.#.###  
+  #.#...#.#.#...#.#.#...#...#...#.#.......#  
+  #.###.#######.###.###.#.###.###.#.#######  
+  #...#.......#.#...#...#.............#...#  
+  #.#########.#######.#.#######.#######.###  
+  #...#.#    F       R I       Z    #.#.#.#  
+  #.###.#    D       E C       H    #.#.#.#  
+  #.#...#                           #...#.#  
+  #.###.#                           #.###.#  
+  #.#....OA                       WB..#.#..ZH
+  #.###.#                           #.#.#.#  
+CJ......#                           #.....#  
+  #######                           #######  
+  #.#....CK                         #......IC
+  #.###.#                           #.###.#  
+  #.....#                           #...#.#  
+  ###.###                           #.#.#.#  
+XF....#.#                         RF..#.#.#  
+  #####.#                           #######  
+  #......CJ                       NM..#...#  
+  ###.#.#                           #.###.#  
+RE....#.#                           #......RF
+  ###.###        X   X       L      #.#.#.#  
+  #.....#        F   Q       P      #.#.#.#  
+  ###.###########.###.#######.#########.###  
+  #.....#...#.....#.......#...#.....#.#...#  
+  #####.#.###.#######.#######.###.###.#.#.#  
+  #.......#.......#.#.#.#.#...#...#...#.#.#  
+  #####.###.#####.#.#.#.#.###.###.#.###.###  
+  #.......#.....#.#...#...............#...#  
+  #############.#.#.###.###################  
+               A O F   N                     
+               A A D   M                     
+"""
+
+
+def test1():
+    assert part1(TEST1) == 23
+
+
+def test2():
+    assert part2(TEST1) == 26
+    assert part2(TEST2) == 396
 
 
 if __name__ == "__main__":
+    test1()
+    test2()
     with open(sys.argv[1]) as f:
         map_str = f.read()
 
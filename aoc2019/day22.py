@@ -1,38 +1,69 @@
 #!/usr/bin/env python
 
-import re
+from collections import namedtuple
+from dataclasses import dataclass
+from functools import lru_cache
 import sys
 
 
+# the shuffling techniques
+NEW_STACK = 0
+INCREMENT = 1
+CUT = 2
+
+
+Instr = namedtuple("Instr", ["op", "arg"])
+
+
+def parse_instr(line):
+    # plain string operations are plenty for this, and cheaper than regexes
+    words = line.split()
+    if words == ["deal", "into", "new", "stack"]:
+        return Instr(NEW_STACK, 0)
+    elif words[:3] == ["deal", "with", "increment"] and len(words) == 4:
+        return Instr(INCREMENT, int(words[3]))
+    elif words[:1] == ["cut"] and len(words) == 2:
+        return Instr(CUT, int(words[1]))
+    else:
+        raise ValueError(f"unparsable instruction {line}")
+
+
+@lru_cache
+def parse_lines(lines):
+    return tuple(parse_instr(line) for line in lines)
+
+
+def parse_instructions(instructions):
+    """Turn lines of shuffling instructions into a tuple of Instrs.
+
+    The result is cached, so the same instructions are only parsed once, even
+    when they're used for several decks (or by both the deck simulation and
+    Shuffle).
+    """
+    return parse_lines(tuple(instructions))
+
+
 def perform_instr(deck, instr):
-    if re.match("deal into new stack$", instr):
+    if instr.op == NEW_STACK:
         deck.reverse()
         return deck
-    elif match := re.match("deal with increment (.*)$", instr):
-        increment = int(match[1])
+    elif instr.op == INCREMENT:
         new_deck = [None] * len(deck)
         for ix, card in enumerate(deck):
-            new_deck[(ix * increment) % len(deck)] = card
+            new_deck[(ix * instr.arg) % len(deck)] = card
         return new_deck
-    elif match := re.match("cut (.*)$", instr):
-        cut = int(match[1])
-        return deck[cut:] + deck[:cut]
+    elif instr.op == CUT:
+        return deck[instr.arg :] + deck[: instr.arg]
     else:
-        raise ValueError(f"unparsable instruction {instr}")
+        raise ValueError(f"bad instruction {instr}")
 
 
 def do_instructions(deck, instructions):
-    for instr in instructions:
+    for instr in parse_instructions(instructions):
         deck = perform_instr(deck, instr)
     return deck
 
 
-def part1(instructions):
-    deck = list(range(10007))
-    deck = do_instructions(deck, instructions)
-    return deck.index(2019)
-
-
 def euclid_wallis(mod, num):
     # requires gcd(mod, num) == 1?
     # calculates k such that (k * num) % mod == 1
@@ -46,69 +77,111 @@ def euclid_wallis(mod, num):
     return lcol[1] % mod
 
 
-def perform_instr_backwards(deck_len, instr):
-    if re.match("deal into new stack$", instr):
-        yield ("add", 1)
-        yield ("mul", -1)
-    elif match := re.match("deal with increment (.*)$", instr):
-        increment = int(match[1])
-        #   after = (increment * before) % deck_len
-        # (note: we're shuffling backwards, i.e. going from "after" to "before")
-        # want to find m such that (m * increment) % deck_len == 1, i.e.:
-        #   m * after = (m * increment * before) % deck_len
-        #   m * after = before % deck_len
-        multiplier = euclid_wallis(deck_len, increment)
-        yield ("mul", multiplier)
-    elif match := re.match("cut (.*)$", instr):
-        cut = int(match[1])
-        yield ("add", cut)
+@dataclass(frozen=True)
+class Shuffle:
+    """A shuffle of a deck of n cards, as a map between positions.
+
+    Every shuffling technique moves the card at position x to position
+    (a * x + b) % n, and so does any sequence of them. Knowing a and b is
+    enough to find where any card ends up, without doing any shuffling.
+    """
+
+    a: int
+    b: int
+    n: int
+
+    def apply(self, pos):
+        """Return where the card at position pos ends up."""
+        return (self.a * pos + self.b) % self.n
+
+    def apply_all(self, positions):
+        """Return where the cards at each of positions end up."""
+        # a plain loop over ints. every intermediate value needs about twice
+        # the bits of n (around 94 for part 2), which wouldn't fit in a
+        # machine integer anyway.
+        a, b, n = self.a, self.b, self.n
+        return [(a * pos + b) % n for pos in positions]
+
+    def deck(self):
+        """Return the whole deck after shuffling, as a list of cards.
+
+        Starting from a deck in factory order, the card at each position is
+        one step of the inverse map further than the one before it.
+        """
+        inverse = self.inverse()
+        step = inverse.a
+        n = self.n
+        deck = [0] * n
+        card = inverse.b
+        for pos in range(n):
+            deck[pos] = card
+            card += step
+            if card >= n:
+                card -= n
+        return deck
+
+    def then(self, other):
+        """Return the shuffle doing this shuffle, followed by other."""
+        return Shuffle(
+            (other.a * self.a) % self.n,
+            (other.a * self.b + other.b) % self.n,
+            self.n,
+        )
+
+    def inverse(self):
+        """Return the shuffle which undoes this one.
+
+        Its apply() tells which card ends up at a position.
+        """
+        #   after = (a * before + b) % n
+        # so with m such that (m * a) % n == 1:
+        #   before = (m * (after - b)) % n
+        m = euclid_wallis(self.n, self.a)
+        return Shuffle(m, (-m * self.b) % self.n, self.n)
+
+    def power(self, times):
+        """Return the shuffle doing this shuffle times times in a row."""
+        if times < 0:
+            return self.inverse().power(-times)
+        # repeated squaring
+        result = Shuffle(1, 0, self.n)
+        square = self
+        while times:
+            if times & 1:
+                result = result.then(square)
+            square = square.then(square)
+            times >>= 1
+        return result
+
+
+def instr_shuffle(deck_len, instr):
+    if instr.op == NEW_STACK:
+        return Shuffle(deck_len - 1, deck_len - 1, deck_len)
+    elif instr.op == INCREMENT:
+        return Shuffle(instr.arg % deck_len, 0, deck_len)
+    elif instr.op == CUT:
+        return Shuffle(1, -instr.arg % deck_len, deck_len)
     else:
-        raise ValueError(f"unparsable instruction {instr}")
+        raise ValueError(f"bad instruction {instr}")
+
+
+def make_shuffle(deck_len, instructions):
+    """Combine all instructions into a single Shuffle."""
+    shuffle = Shuffle(1, 0, deck_len)
+    for instr in parse_instructions(instructions):
+        shuffle = shuffle.then(instr_shuffle(deck_len, instr))
+    return shuffle
+
+
+def part1(instructions):
+    return make_shuffle(10007, instructions).apply(2019)
 
 
 def do_backwards(deck_ix, deck_len, iterations, instructions):
-    # all shuffling instructions can be expressed as modular addition or
-    # multiplication. actually applying the modulo can be deferred as desired.
-    xs = 1
-    ones = 0
-    for instr in reversed(instructions):
-        for op, val in perform_instr_backwards(deck_len, instr):
-            if op == "add":
-                ones += val
-            elif op == "mul":
-                xs *= val
-                ones *= val
-    # the result is given by repeatedly applying, "iterations" times:
-    #   x * xs + ones
-    # (where x initially equals deck_ix)
-    # let I = iterations, then the result of the repeated application is
-    # given by:
-    #   deck_ix * xs^I + (1 + xs + xs² + ... + xs^(I - 1)) * ones
-    # (all modulo deck_len)
-    # the parenthesized expression is a geometric series, which can be
-    # efficiently calculated using the "repeated squaring" method.
-    total_xs = pow(xs, iterations, deck_len)
-    geo = geosum(xs, iterations - 1, deck_len)
-    return (deck_ix * total_xs + geo * ones) % deck_len
-
-
-def geosum(a, n, mod):
-    # using repeated squaring, calculates the value of:
-    #  (1 + a + a^2 + ... + a^n) % mod
-    if n == 0:
-        return 1
-    # let n == 2m + 1:
-    #     (1 + a + a² + ... + a^(2m + 1)) % mod
-    #  == (a + 1) * (1 + a² + (a²)² + ... + (a²)^m) % mod
-    # note that `n // 2` discards the last bit, so if n is even, the right
-    # hand side (i.e. "result") will have an extra a^(n + 1) term which needs
-    # subtracting.
-    a2 = (a * a) % mod
-    result = (a + 1) * geosum(a2, n // 2, mod)
-    if n % 2 == 1:
-        return result % mod
-    else:
-        return (result - pow(a, n + 1, mod)) % mod
+    # find the card which ends up at deck_ix after shuffling "iterations"
+    # times, by undoing all of the shuffles at once.
+    shuffle = make_shuffle(deck_len, instructions)
+    return shuffle.power(iterations).inverse().apply(deck_ix)
 
 
 def part2(instructions):
@@ -160,6 +233,9 @@ def test1_case(instrs_str, expected):
         print(f"deck:      {deck}")
         print(f"expected:  {expected}")
     assert expected == deck
+    shuffle = make_shuffle(10, instrs_str.splitlines())
+    assert shuffle.apply_all(expected) == list(range(10))
+    assert shuffle.deck() == expected
 
 
 TEST_0_EXPECTED = [0, 3, 6, 9, 2, 5, 8, 1, 4, 7]
@@ -180,10 +256,20 @@ def test2_case(instrs_str, expected):
     # use a single iteration....
     for ix, card in enumerate(expected):
         assert card == do_backwards(ix, 10, 1, instrs_str.splitlines())
+    # ...so compare repeated shuffles against actually shuffling
+    instructions = instrs_str.splitlines()
+    deck = list(range(10))
+    for iterations in range(1, 6):
+        deck = do_instructions(deck, instructions)
+        for ix, card in enumerate(deck):
+            assert card == do_backwards(ix, 10, iterations, instructions)
 
 
 def test2():
     assert euclid_wallis(26, 7) == 15
+    shuffle = make_shuffle(10, TEST_3.splitlines())
+    assert shuffle.then(shuffle.inverse()) == Shuffle(1, 0, 10)
+    assert shuffle.power(-3) == shuffle.inverse().power(3)
     test2_case(TEST_0, TEST_0_EXPECTED)
     test2_case(TEST_1, TEST_1_EXPECTED)
     test2_case(TEST_2, TEST_2_EXPECTED)
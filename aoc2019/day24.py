@@ -1,191 +1,159 @@
 #!/usr/bin/env python
 
-from collections import defaultdict
-from itertools import chain
 import sys
 
-
-def count_neighbours(grid, x, y):
-    s = 0
-    if x > 0:
-        if grid[y][x - 1] == "#":
-            s += 1
-    if y > 0:
-        if grid[y - 1][x] == "#":
-            s += 1
-    if x < len(grid[0]) - 1:
-        if grid[y][x + 1] == "#":
-            s += 1
-    if y < len(grid) - 1:
-        if grid[y + 1][x] == "#":
-            s += 1
-    return s
-
-
-def step_coord(grid, x, y):
-    if grid[y][x] == "#":
-        if count_neighbours(grid, x, y) == 1:
-            return "#"
-        else:
-            return "."
-    else:
-        if count_neighbours(grid, x, y) in (1, 2):
-            return "#"
-        else:
-            return "."
-
-
-def step_grid(grid):
-    return tuple(
-        tuple(step_coord(grid, x, y) for x, _ in enumerate(line))
-        for y, line in enumerate(grid)
-    )
+from aoc2019.cycles import brent
 
 
-def biodiversity(grid):
-    s = 0
-    for ix, ch in enumerate(chain(*grid)):
-        if ch == "#":
-            s += 2 ** ix
-    return s
+# a grid is stored as a 25-bit int, where bit (5 * y + x) is set if there's a
+# bug at (x, y). this also happens to be the biodiversity rating.
+FULL = (1 << 25) - 1
+COL0 = sum(1 << (5 * y) for y in range(5))
+COL4 = COL0 << 4
+ROW0 = (1 << 5) - 1
+ROW4 = ROW0 << 20
 
 
-def part1(map_str):
-    grid = tuple(tuple(ch for ch in l.strip()) for l in map_str.splitlines())
-    seen = set()
-    while grid not in seen:
-        seen.add(grid)
-        grid = step_grid(grid)
-    return biodiversity(grid)
-
-
-def adjacent_p2(x, y, z):
-    # we don't talk about the center square
-    if (x, y) == (2, 2):
-        return []
-
-    adjacent = []
-
-    # look left
-    if x == 0:
-        # looking out
-        adjacent.append((1, 2, z - 1))
-    elif (x, y) == (3, 2):
-        # looking in
-        adjacent.extend((4, yy, z + 1) for yy in range(5))
-    else:
-        adjacent.append((x - 1, y, z))
-
-    # look right
-    if x == 4:
-        # looking out
-        adjacent.append((3, 2, z - 1))
-    elif (x, y) == (1, 2):
-        # looking in
-        adjacent.extend((0, yy, z + 1) for yy in range(5))
-    else:
-        adjacent.append((x + 1, y, z))
-
-    # look up
-    if y == 0:
-        # looking out
-        adjacent.append((2, 1, z - 1))
-    elif (x, y) == (2, 3):
-        # looking in
-        adjacent.extend((xx, 4, z + 1) for xx in range(5))
-    else:
-        adjacent.append((x, y - 1, z))
-
-    # look down
-    if y == 4:
-        # looking out
-        adjacent.append((2, 3, z - 1))
-    elif (x, y) == (2, 1):
-        # looking in
-        adjacent.extend((xx, 0, z + 1) for xx in range(5))
-    else:
-        adjacent.append((x, y + 1, z))
-
-    return adjacent
-
-
-def count_neighbours_p2(grids, x, y, z):
-    adjacent = adjacent_p2(x, y, z)
-    ch = grids[z][y][x]
-    n_neighbours = 0
-    for x, y, z in adjacent:
-        # avoid creating new levels that are not adjacent to any bugs, because
-        # if they aren't adjacent to any bugs, they're going to stay empty for
-        # this iteration anyway.
-        # they might still stay empty (if each square is adjacent to 3+ bugs),
-        # but this way, we never create more than one unnecessary level (in
-        # each direction).
-        if z not in grids and ch != "#":
-            continue
-        if grids[z][y][x] == "#":
-            n_neighbours += 1
-    return n_neighbours
-
-
-def step_coord_p2(grids, x, y, z):
-    if grids[z][y][x] == "#":
-        if count_neighbours_p2(grids, x, y, z) == 1:
-            return "#"
-        else:
-            return "."
-    else:
-        if count_neighbours_p2(grids, x, y, z) in (1, 2):
-            return "#"
-        else:
-            return "."
-
-
-def step_grid_p2(grids, z):
-    return tuple(
-        tuple(step_coord_p2(grids, x, y, z) for x, _ in enumerate(line))
-        for y, line in enumerate(grids[z])
-    )
+def parse_grid(map_str):
+    state = 0
+    for y, line in enumerate(map_str.split()):
+        for x, ch in enumerate(line):
+            if ch == "#":
+                state |= 1 << (5 * y + x)
+    return state
 
 
-def empty_grid():
-    return tuple(tuple("." for _ in range(5)) for _ in range(5))
+def count_neighbours(neighbours):
+    """Count the bugs in neighbours, for all 25 positions at once.
 
+    neighbours is a list of four grids, holding the left/right/up/down
+    neighbour of each position. Returns two grids: the positions with exactly
+    one neighbouring bug, and the positions with exactly two.
+    """
+    left, right, up, down = neighbours
+    # add up the four single bits with half adders
+    sum_lr = left ^ right
+    sum_ud = up ^ down
+    carry = (left & right) ^ (up & down) ^ (sum_lr & sum_ud)
+    odd = sum_lr ^ sum_ud
+    # an odd count is 1 or 3, and the twos bit is only set for 3. an even
+    # count with the twos bit set can only be 2 (4 has it unset).
+    return odd & ~carry, carry & ~odd
 
-def iterate(grids):
-    new_grids = defaultdict(empty_grid)
-    # step_grid_p2 will potentially create new levels (see comment in
-    # count_neighbours_p2).
-    grids_to_scan = set(grids)
-    for z in grids_to_scan:
-        new_grids[z] = step_grid_p2(grids, z)
-    # step any new levels that were implicitly created. note that this cannot
-    # create additional levels, so there's no need for yet another loop.
-    for z in set(grids) - grids_to_scan:
-        new_grids[z] = step_grid_p2(grids, z)
-    return new_grids
 
-
-def count_bugs(grids):
-    return len(
+def step_grid(state):
+    one, two = count_neighbours(
         [
-            ch
-            for grid in grids.values()
-            for line in grid
-            for ch in line
-            if ch == "#"
+            (state << 1) & ~COL0,
+            (state >> 1) & ~COL4,
+            (state << 5) & FULL,
+            state >> 5,
         ]
     )
+    # bugs survive with exactly one neighbour, and empty spaces get infested
+    # with one or two.
+    return (one | (two & ~state)) & FULL
+
+
+def part1(map_str):
+    state = parse_grid(map_str)
+    # the first layout to appear twice is the first one in the cycle
+    mu, _ = brent(step_grid, state)
+    for _ in range(mu):
+        state = step_grid(state)
+    return state
+
+
+CENTER = 1 << 12
+
+# in part 2, the cells around the center are next to a whole edge of the
+# level inside them. (cell, the cell's neighbours in its own level, the edge
+# of the inner level next to it)
+AROUND_CENTER = (
+    (7, 1 << 2 | 1 << 6 | 1 << 8, ROW0),
+    (11, 1 << 6 | 1 << 10 | 1 << 16, COL0),
+    (13, 1 << 8 | 1 << 14 | 1 << 18, COL4),
+    (17, 1 << 16 | 1 << 18 | 1 << 22, ROW4),
+)
+# every other cell has exactly four neighbours, like in part 1
+REGULAR = FULL & ~CENTER & ~sum(1 << cell for cell, _, _ in AROUND_CENTER)
+
+
+def count_bits(state):
+    return bin(state).count("1")
+
+
+def step_level(outer, level, inner):
+    # cells on an edge have a cell around the center of the outer level as
+    # their neighbour on that side
+    left = (level << 1) & ~COL0
+    right = (level >> 1) & ~COL4
+    up = (level << 5) & FULL
+    down = level >> 5
+    if outer >> 11 & 1:
+        left |= COL0
+    if outer >> 13 & 1:
+        right |= COL4
+    if outer >> 7 & 1:
+        up |= ROW0
+    if outer >> 17 & 1:
+        down |= ROW4
+    one, two = count_neighbours([left, right, up, down])
+    new_level = (one | (two & ~level)) & REGULAR
+    # the cells around the center can have more than four neighbours, so
+    # count those one at a time
+    for cell, own_neighbours, edge in AROUND_CENTER:
+        count = count_bits(level & own_neighbours) + count_bits(inner & edge)
+        if count == 1 or (count == 2 and not level >> cell & 1):
+            new_level |= 1 << cell
+    return new_level
+
+
+def iterate(levels):
+    """Step all levels of the recursive grid by one minute.
+
+    levels is a list of grids (like in part 1), from the outermost to the
+    innermost one. Only levels next to ones with bugs can get any, so the list
+    grows by at most one level at each end.
+    """
+    if levels[0]:
+        levels = [0] + levels
+    if levels[-1]:
+        levels = levels + [0]
+    padded = [0] + levels + [0]
+    return [
+        step_level(padded[ix - 1], padded[ix], padded[ix + 1])
+        for ix in range(1, len(padded) - 1)
+    ]
 
 
 def part2(map_str, steps=200):
-    grid = tuple(tuple(ch for ch in l.strip()) for l in map_str.splitlines())
-    grids = defaultdict(empty_grid, {0: grid})
-    for s in range(steps):
-        grids = iterate(grids)
-    return count_bugs(grids)
+    levels = [parse_grid(map_str)]
+    for _ in range(steps):
+        levels = iterate(levels)
+    return sum(count_bits(level) for level in levels)
+
+
+TEST = """\
+....#
+#..#.
+#..##
+..#..
+#....
+"""
+
+
+def test1():
+    assert part1(TEST) == 2129920
+
+
+def test2():
+    assert part2(TEST, 10) == 99
 
 
 if __name__ == "__main__":
+    test1()
+    test2()
     with open(sys.argv[1]) as f:
         map_str = f.read()
 
@@ -0,0 +1,66 @@
+class Grid:
+    """A map, stored as a flat bytearray with one byte per tile.
+
+    Cells are identified by their index into the bytearray, so moving to an
+    adjacent cell is just adding one of the offsets. The map is surrounded by
+    a border of fill tiles, so stepping off any tile of the map stays within
+    the bytearray: the single padding column at the start of each row also
+    serves as the right border of the row before it.
+    """
+
+    def __init__(self, map_str, fill=" "):
+        lines = map_str.splitlines()
+        self.width = max(len(line) for line in lines)
+        self.height = len(lines)
+        self.stride = self.width + 1
+        rows = [fill * self.stride]
+        rows += [fill + line.ljust(self.width, fill) for line in lines]
+        rows += [fill * (self.stride + 1)]
+        self.cells = bytearray("".join(rows), "ascii")
+        self.offsets = (-1, 1, -self.stride, self.stride)
+
+    def __getitem__(self, cell):
+        return chr(self.cells[cell])
+
+    def __setitem__(self, cell, tile):
+        self.cells[cell] = ord(tile)
+
+    def __str__(self):
+        return "\n".join(
+            self.cells[self.cell(0, y) : self.cell(self.width, y)].decode()
+            for y in range(self.height)
+        )
+
+    def cell(self, x, y):
+        return (y + 1) * self.stride + x + 1
+
+    def pos(self, cell):
+        y, x = divmod(cell, self.stride)
+        return x - 1, y - 1
+
+    def find(self, tile):
+        """Return the first cell containing tile, or None."""
+        cell = self.cells.find(ord(tile))
+        return cell if cell >= 0 else None
+
+    def classify(self, table):
+        """Map every cell through a lookup table (see lookup_table()).
+
+        The values in the table must fit in a byte. The result is a bytearray
+        indexed by cell, like self.cells.
+        """
+        return self.cells.translate(bytes(table))
+
+
+def lookup_table(classes, default=0):
+    """Make a table for looking up a value for each tile, by its byte value.
+
+    classes maps strings of tiles to the value for each of those tiles.
+    Indexing the table with a byte from Grid.cells is much cheaper than
+    comparing tiles as strings.
+    """
+    table = [default] * 256
+    for tiles, value in classes.items():
+        for tile in tiles:
+            table[ord(tile)] = value
+    return table
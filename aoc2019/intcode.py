@@ -37,6 +37,18 @@ class Computer(object):
         self.inp = inp if inp is not None else iter(())
         self.name = name if name is not None else ""  # for debugging
 
+    def fork(self, inp=None):
+        """Return a copy of this computer, paused at the same instruction.
+
+        The copy gets its own memory, so running it does not affect the
+        original. inp is the new computer's input iterator.
+        """
+        com = Computer((), inp=inp, name=self.name)
+        com.mem = self.mem.copy()
+        com.pc = self.pc
+        com.relbase = self.relbase
+        return com
+
     def run(self, slowly=False):
         """Run the program, yielding the results of output instructions.
 
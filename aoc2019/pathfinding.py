@@ -0,0 +1,51 @@
+def distance_map(passable, sources, offsets):
+    """Find the distance to every reachable cell from the closest source.
+
+    The map is given as a flat sequence (e.g. a bytearray) which is non-zero
+    for cells that can be entered, and offsets are the differences in index
+    between adjacent cells. The map must have a border of cells that can't be
+    entered, so that stepping from any enterable cell stays within the map.
+
+    Returns a list with the distance to each cell, or -1 for cells that can't
+    be reached.
+    """
+    dist = [-1] * len(passable)
+    frontier = list(sources)
+    for source in frontier:
+        dist[source] = 0
+    steps = 0
+    # expand the whole frontier one step at a time, rather than one cell at a
+    # time, so that the step count doesn't need to be stored in a queue.
+    while frontier:
+        steps += 1
+        new_frontier = []
+        for cell in frontier:
+            for offset in offsets:
+                neighbour = cell + offset
+                if passable[neighbour] and dist[neighbour] < 0:
+                    dist[neighbour] = steps
+                    new_frontier.append(neighbour)
+        frontier = new_frontier
+    return dist
+
+
+def test_distance_map():
+    map_str = "#####\n#..##\n#.#.#\n#...#\n#####"
+    width = map_str.index("\n") + 1
+    passable = [int(tile == ".") for tile in map_str]
+    dist = distance_map(passable, [map_str.index(".")], (-1, 1, -width, width))
+    assert [dist[width * y + 1 : width * y + 4] for y in range(1, 4)] == [
+        [0, 1, -1],
+        [1, -1, 5],
+        [2, 3, 4],
+    ]
+    # several sources at once: each cell gets the distance to the closest
+    sources = [width + 1, 3 * width + 3]
+    dist = distance_map(passable, sources, (-1, 1, -width, width))
+    assert dist[width + 2] == 1
+    assert dist[2 * width + 3] == 1
+    assert dist[3 * width + 1] == 2
+
+
+if __name__ == "__main__":
+    test_distance_map()